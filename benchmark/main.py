@@ -0,0 +1,684 @@
+import importlib.util
+import json
+import gzip
+import io
+import os
+import sys
+import time
+import random
+import resource
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from contextlib import redirect_stdout
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Callable
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INDEX_DIR = os.path.join(ROOT, 'index')
+
+sys.path.append(ROOT)
+from common.compact_index import CompactIndex, load_index, load_analyzer_config
+from common.analyzer import Analyzer
+
+
+def load_module(name : str, path : str) -> object:
+    """ Load a main.py file as a module named (name). Every part of the project
+        lives in a main.py, so they cannot be imported by their file name. """
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def load_index_module() -> object:
+    return load_module('index_main', os.path.join(ROOT, 'index', 'main.py'))
+
+def load_ranking_module() -> object:
+    return load_module('ranking_main', os.path.join(ROOT, 'ranking', 'main.py'))
+
+def load_crawler_module() -> object:
+    return load_module('crawler_main', os.path.join(ROOT, 'crawler', 'main.py'))
+
+
+### Measurement related ###
+
+def read_proc_status(field : str) -> int:
+    """ Value, in bytes, of a memory field (VmRSS, VmHWM) of /proc/self/status, None if there
+        is no /proc (macOS). """
+    try:
+        with open('/proc/self/status', 'r') as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    # values are given in kB
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+def get_rss_bytes() -> int:
+    """ Current resident set size of the current process, in bytes. """
+    rss = read_proc_status('VmRSS')
+    return rss if rss is not None else get_peak_rss_bytes()
+
+def get_peak_rss_bytes() -> int:
+    """ Peak resident set size of the current process, in bytes. On Linux, ru_maxrss is inherited
+        from the parent process, so the high water mark of the process itself (VmHWM) is used. """
+    peak_rss = read_proc_status('VmHWM')
+    if peak_rss is not None:
+        return peak_rss
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    if sys.platform == 'darwin':
+        return max_rss
+    return max_rss * 1024
+
+def run_isolated(workload : Callable, *args) -> dict:
+    """ Run a workload in a fresh interpreter so that its peak RSS is not polluted
+        by the previous workloads. The workload must return a dictionary. """
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes=1) as pool:
+        return pool.apply(measured, (workload,) + args)
+
+def measured(workload : Callable, *args) -> dict:
+    """ Run a workload and add its peak RSS to the returned dictionary. """
+    baseline_rss = get_peak_rss_bytes()
+    result = workload(*args)
+    result["baseline_rss_bytes"] = baseline_rss
+    result["peak_rss_bytes"] = get_peak_rss_bytes()
+    return result
+
+def latency_distribution(latencies : List[float]) -> dict:
+    """ Given a list of latencies (in seconds), return its distribution in milliseconds. """
+    if len(latencies) == 0:
+        return {"n": 0}
+    latencies = sorted(latencies)
+
+    def percentile(p : float) -> float:
+        return 1000 * latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    return {
+        "n": len(latencies),
+        "mean_ms": 1000 * sum(latencies) / len(latencies),
+        "min_ms": 1000 * latencies[0],
+        "p50_ms": percentile(0.50),
+        "p90_ms": percentile(0.90),
+        "p99_ms": percentile(0.99),
+        "max_ms": 1000 * latencies[-1]
+    }
+
+### --- ###
+
+
+### Synthetic corpus ###
+
+def generate_vocabulary(size : int, rng : random.Random) -> List[str]:
+    """ Generate (size) distinct pseudo words. """
+    letters = 'abcdefghijklmnopqrstuvwxyzéè'
+    vocabulary = set()
+    while len(vocabulary) < size:
+        vocabulary.add(''.join(rng.choices(letters, k=rng.randint(2, 10))))
+    return sorted(vocabulary)
+
+def generate_corpus(n_docs : int,
+                    vocabulary_size : int = 5000,
+                    tokens_by_field : dict = None,
+                    seed : int = 0) -> List[dict]:
+    """ Generate (n_docs) documents with the same shape as crawled_urls.json. Words
+        follow a Zipf law, as in natural language, so that posting lengths are realistic. """
+    if tokens_by_field is None:
+        tokens_by_field = {"title": 12, "content": 300, "h1": 8}
+    rng = random.Random(seed)
+    vocabulary = generate_vocabulary(vocabulary_size, rng)
+    weights = [1 / (rank + 1) for rank in range(vocabulary_size)]
+
+    corpus = []
+    for doc_index in range(n_docs):
+        document = {"id": doc_index, "url": f"https://example.org/page/{doc_index}"}
+        for field, n_tokens in tokens_by_field.items():
+            document[field] = ' '.join(rng.choices(vocabulary, weights=weights, k=n_tokens))
+        corpus.append(document)
+    return corpus
+
+### --- ###
+
+
+### On-disk formats ###
+
+def encode_varint(number : int, buffer : bytearray) -> None:
+    """ Append the variable byte encoding of (number) to (buffer). """
+    while number >= 128:
+        buffer.append((number & 127) | 128)
+        number >>= 7
+    buffer.append(number)
+
+def encode_delta_varint(index : dict) -> bytes:
+    """ Encode an index (positional or not) as delta + variable byte postings.
+        Terms are stored in utf-8, followed by their postings. """
+    buffer = bytearray()
+    for term, postings in index.items():
+        encoded_term = term.encode()
+        encode_varint(len(encoded_term), buffer)
+        buffer += encoded_term
+        doc_ids = sorted(int(doc) for doc in postings)
+        encode_varint(len(doc_ids), buffer)
+        previous_doc = 0
+        for doc in doc_ids:
+            encode_varint(doc - previous_doc, buffer)
+            previous_doc = doc
+            if isinstance(postings, dict):
+                positions = postings[str(doc)] if str(doc) in postings else postings[doc]
+                encode_varint(len(positions), buffer)
+                previous_position = 0
+                for position in positions:
+                    encode_varint(position - previous_position, buffer)
+                    previous_position = position
+    return bytes(buffer)
+
+def compact_size(index : dict) -> int:
+    """ Size, in bytes, of an index saved as a CompactIndex. """
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'index.cidx')
+        CompactIndex.from_dict(index).save(filename)
+        return os.path.getsize(filename)
+
+def size_by_format(index : dict) -> dict:
+    """ On-disk size, in bytes, of an index for each candidate format. """
+    json_indented = json.dumps(index, indent=2).encode()
+    json_compact = json.dumps(index, separators=(',', ':')).encode()
+    return {
+        "json_indent_2": len(json_indented),
+        "json_compact": len(json_compact),
+        "json_compact_gzip": len(gzip.compress(json_compact)),
+        "delta_varint": len(encode_delta_varint(index)),
+        "compact_index": compact_size(index)
+    }
+
+### --- ###
+
+
+### Index build workload ###
+
+def build_index_workload(n_docs : int, positional : bool, stemmerize : bool, tokenizer : str, seed : int) -> dict:
+    """ Build an index over a synthetic corpus, return throughput and on-disk sizes. """
+    index_main = load_index_module()
+    corpus = generate_corpus(n_docs=n_docs, seed=seed)
+    fields = ["title", "content", "h1"]
+    index = index_main.Index(crawled=corpus, tokenizer=index_main.Tokenizer(language='french', mode=tokenizer), fields=fields)
+
+    start = time.perf_counter()
+    if positional:
+        built = index.positional_indexation(stemmerize=stemmerize)
+    else:
+        built = index.non_positional_indexation(stemmerize=stemmerize)
+    elapsed = time.perf_counter() - start
+
+    n_tokens = sum(len(document[field].split()) for document in corpus for field in fields)
+    return {
+        "n_docs": n_docs,
+        "positional": positional,
+        "stemmerize": stemmerize,
+        "tokenizer": tokenizer,
+        "seconds": elapsed,
+        "docs_per_second": n_docs / elapsed,
+        "tokens_per_second": n_tokens / elapsed,
+        "size_by_format": {field: size_by_format(built[i]) for i, field in enumerate(fields)}
+    }
+
+def error_message(error : Exception) -> str:
+    """ First line of an error message. nltk surrounds its messages (ex : missing punkt data)
+        with lines of stars. """
+    return [line.strip() for line in str(error).splitlines() if line.strip(' *')][0]
+
+def load_corpus(corpus_path : str, n_docs : int, seed : int) -> List[dict]:
+    """ The crawled corpus (crawled_urls.json) if it exists, a synthetic corpus otherwise. """
+    if os.path.exists(corpus_path):
+        return load_json(corpus_path)[:n_docs]
+    return generate_corpus(n_docs=n_docs, seed=seed)
+
+def tokenizer_workload(corpus_path : str, n_docs : int, seed : int) -> dict:
+    """ Compare the tokenizers of the Analyzer on the contents of a corpus : nltk word_tokenize,
+        str.split, the compiled regex, and the regex with stemming. """
+    corpus = load_corpus(corpus_path, n_docs=n_docs, seed=seed)
+    contents = [document["content"] for document in corpus]
+    # each run is (analyzer, tokenization of the contents by the analyzer)
+    runs = {
+        "nltk": (lambda: Analyzer(tokenizer='nltk'),
+                 lambda analyzer: [analyzer.tokenize(content) for content in contents]),
+        "whitespace": (lambda: Analyzer(tokenizer='whitespace'),
+                       lambda analyzer: [analyzer.tokenize(content) for content in contents]),
+        "regex": (lambda: Analyzer(tokenizer='regex'),
+                  lambda analyzer: [analyzer.tokenize(content) for content in contents]),
+        "regex_stemming_analyze_many": (lambda: Analyzer(tokenizer='regex', stemming=True),
+                                        lambda analyzer: analyzer.analyze_many(contents))
+    }
+    results = {"corpus": os.path.basename(corpus_path) if os.path.exists(corpus_path) else "synthetic",
+               "n_docs": len(contents)}
+    for name, (build, run) in runs.items():
+        try:
+            # the analyzer is built and warmed up (nltk import and data, stemmer) before the timer
+            analyzer = build()
+            analyzer.analyze("warm up")
+            start = time.perf_counter()
+            tokens = run(analyzer)
+            elapsed = time.perf_counter() - start
+        except (ImportError, LookupError) as e:
+            # nltk or its punkt data may be missing
+            results[name] = {"error": error_message(e)}
+            continue
+        n_tokens = sum(len(tokens_by_content) for tokens_by_content in tokens)
+        results[name] = {"seconds": elapsed, "tokens": n_tokens, "tokens_per_second": n_tokens / elapsed}
+    return results
+
+### --- ###
+
+
+### Query workload ###
+
+def phrase_query(index : CompactIndex, tokens : List[str]) -> List[int]:
+    """ Docs of a positional CompactIndex in which (tokens) appear consecutively. Relies on the
+        postings of the project (PostingList.doc_ids and positions_of), so that their regressions
+        show up in the phrase latency. """
+    posting_lists = [index.get(token) for token in tokens]
+    if len(posting_lists) == 0 or None in posting_lists:
+        return []
+    docs = set(posting_lists[0].doc_ids)
+    for posting_list in posting_lists[1:]:
+        docs.intersection_update(posting_list.doc_ids)
+
+    matched = []
+    for doc in sorted(docs):
+        positions = set(posting_lists[0].positions_of(doc))
+        for offset, posting_list in enumerate(posting_lists[1:], start=1):
+            positions &= {position - offset for position in posting_list.positions_of(doc)}
+            if len(positions) == 0:
+                break
+        if len(positions) > 0:
+            matched.append(doc)
+    return matched
+
+def generate_queries(index : dict, n_queries : int, max_length : int, seed : int) -> List[str]:
+    """ Sample queries of 1 to (max_length) terms. Terms are drawn according to their
+        document frequency, like terms of real queries. """
+    rng = random.Random(seed)
+    terms = sorted(index.keys())
+    weights = [len(index[term]) for term in terms]
+    return [' '.join(rng.choices(terms, weights=weights, k=rng.randint(1, max_length)))
+            for _ in range(n_queries)]
+
+def generate_phrase_queries(index : dict, n_queries : int, max_length : int, seed : int) -> List[str]:
+    """ Sample phrases of 2 to (max_length) terms (at least 2) which exist in a positional index,
+        by rebuilding the token sequence of the documents. A phrase starts at a position followed
+        by another one, so every sample gives a phrase. Empty if no document has two consecutive
+        positions. """
+    rng = random.Random(seed)
+    max_length = max(max_length, 2)
+    sequences = {}
+    for term, postings in index.items():
+        for doc, positions in postings.items():
+            for position in positions:
+                sequences.setdefault(doc, {})[position] = term
+    starts_by_doc = {}
+    for doc, sequence in sorted(sequences.items()):
+        starts = sorted(position for position in sequence if position + 1 in sequence)
+        if len(starts) > 0:
+            starts_by_doc[doc] = starts
+    docs = list(starts_by_doc.keys())
+    if len(docs) == 0:
+        return []
+
+    queries = []
+    for _ in range(n_queries):
+        doc = rng.choice(docs)
+        sequence = sequences[doc]
+        start = rng.choice(starts_by_doc[doc])
+        phrase = []
+        for position in range(start, start + rng.randint(2, max_length)):
+            if position not in sequence:
+                break
+            phrase.append(sequence[position])
+        queries.append(' '.join(phrase))
+    return queries
+
+def query_workload(index_path : str, n_queries : int, max_length : int, treshold : int, seed : int) -> dict:
+    """ Load an index from disk, then measure load time, on-disk sizes and the latency
+        distribution of AND, OR and phrase requests. """
+    ranking_main = load_ranking_module()
+
+    start = time.perf_counter()
+    with open(index_path, 'r') as json_file:
+        index = json.load(json_file)
+    load_seconds = time.perf_counter() - start
+
+    positional = len(index) > 0 and isinstance(next(iter(index.values())), dict)
+    doc_ids = {int(doc) for postings in index.values() for doc in postings}
+    documents = [{'id': doc, 'url': f'doc://{doc}', 'title': ''} for doc in sorted(doc_ids)]
+    # requests are analyzed by the analyzer the index was built with (see its sidecar file)
+    compact = CompactIndex.from_dict(index, metadata={"analyzer": load_analyzer_config(index_path)})
+    ranker = ranking_main.Ranker(compact, documents)
+
+    queries = generate_queries(index, n_queries=n_queries, max_length=max_length, seed=seed)
+    latencies = {}
+    for request_choice in ["AND", "OR"]:
+        latencies[request_choice] = []
+        for query in queries:
+            start = time.perf_counter()
+            try:
+                # the ranker prints statistics for each request
+                with redirect_stdout(io.StringIO()):
+                    ranker.rank(request=query, request_choice=request_choice, treshold=treshold)
+            except (ImportError, LookupError) as e:
+                # nltk or its punkt data may be missing
+                latencies[request_choice] = error_message(e)
+                break
+            latencies[request_choice].append(time.perf_counter() - start)
+
+    if positional:
+        latencies["PHRASE"] = []
+        for query in generate_phrase_queries(index, n_queries=n_queries, max_length=max_length, seed=seed):
+            start = time.perf_counter()
+            phrase_query(ranker.index, query.split())
+            latencies["PHRASE"].append(time.perf_counter() - start)
+
+    return {
+        "index": os.path.relpath(index_path, ROOT),
+        "positional": positional,
+        "n_terms": len(index),
+        "n_docs": len(doc_ids),
+        "file_size_bytes": os.path.getsize(index_path),
+        "load_seconds": load_seconds,
+        "size_by_format": size_by_format(index),
+        "latency": {choice: latency_distribution(values) if isinstance(values, list) else {"error": values}
+                    for choice, values in latencies.items()}
+    }
+
+def convert_workload(index_path : str, compact_path : str) -> dict:
+    """ Save a JSON index as a CompactIndex. It runs in its own process, so that the memory
+        used by the conversion is not counted in the startup of the ranker. """
+    start = time.perf_counter()
+    load_index(index_path).save(compact_path)
+    return {"seconds": time.perf_counter() - start}
+
+def startup_workload(index_path : str, analyzer_config : dict, request : str) -> dict:
+    """ Measure the time between the launch of the ranker and its first answer, for an
+        index stored in JSON or as a CompactIndex (.cidx, loaded lazily), and the resident
+        memory taken by the loaded index. The analyzer (and nltk) is built and warmed up
+        beforehand, so that the load of the index is measured on its own. """
+    ranking_main = load_ranking_module()
+    analyzer = Analyzer.from_config(analyzer_config)
+    try:
+        analyzer.analyze("warm up")
+    except (ImportError, LookupError):
+        # nltk or its punkt data may be missing, the first request reports it
+        pass
+
+    rss_before_load = get_rss_bytes()
+    start = time.perf_counter()
+    index = load_index(index_path)
+    loaded = time.perf_counter()
+    rss_after_load = get_rss_bytes()
+    ranker = ranking_main.Ranker(index, [], analyzer=analyzer)
+    ready = time.perf_counter()
+    try:
+        with redirect_stdout(io.StringIO()):
+            ranker.compute_scores(request=request, request_choice="OR")
+        first_request = time.perf_counter() - ready
+    except (ImportError, LookupError) as e:
+        # nltk or its punkt data may be missing
+        first_request = {"error": error_message(e)}
+    rss_after_first_request = get_rss_bytes()
+
+    return {
+        "index": os.path.basename(index_path),
+        "file_size_bytes": os.path.getsize(index_path),
+        "load_seconds": loaded - start,
+        "index_resident_bytes": rss_after_load - rss_before_load,
+        "ranker_seconds": ready - loaded,
+        "first_request_seconds": first_request,
+        "loaded_terms": len(index.cache),
+        "rss_before_load_bytes": rss_before_load,
+        "rss_after_first_request_bytes": rss_after_first_request
+    }
+
+### --- ###
+
+
+### Crawler workload ###
+
+class MockSiteHandler(BaseHTTPRequestHandler):
+    """ Serve a synthetic website : /robots.txt and /page/<i> with some text and links to other pages.
+        Some links carry a tracking parameter (/page/<i>?utm_source=<n>), which gives a duplicate of the page. """
+    n_pages = 100
+    links_by_page = 10
+    n_requests = 0
+
+    def do_GET(self) -> None:
+        MockSiteHandler.n_requests += 1
+        host = f"http://{self.headers['Host']}"
+        if self.path == '/robots.txt':
+            body = "User-agent: *\nAllow: /\n"
+            content_type = 'text/plain'
+        elif self.path.startswith('/page/'):
+            page = int(self.path.split('?')[0].split('/')[-1])
+            rng = random.Random(page)
+            text = ' '.join(rng.choices(['erreur', 'page', 'ensai', 'cours', 'étudiant', 'master', 'données',
+                                         'statistique', 'admission', 'recherche'], k=60))
+            links = ''.join(f'<a href="{host}/page/{rng.randrange(self.n_pages)}'
+                            f'{"?utm_source=" + str(rng.randrange(100)) if rng.random() < 0.3 else ""}">link</a>'
+                            for _ in range(self.links_by_page))
+            body = f"<html><head><title>Page {page}</title></head><body><h1>Page {page}</h1><p>{text}</p>{links}</body></html>"
+            content_type = 'text/html'
+        else:
+            self.send_error(404)
+            return
+        encoded = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format : str, *args) -> None:
+        """ Keep the benchmark output clean. """
+        return
+
+def crawler_workload(max_crawled_url : int, max_url_by_pages : int, n_pages : int, detect_duplicates : bool) -> dict:
+    """ Crawl a local mock website without politeness, return the crawl throughput. If detect_duplicates
+        is True, the links of near-duplicate pages are not explored. """
+    crawler_main = load_crawler_module()
+    from common.minhash import DuplicateDetector
+    MockSiteHandler.n_pages = n_pages
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockSiteHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    seed = f"http://127.0.0.1:{server.server_address[1]}/page/0"
+
+    # the crawler writes its age database in the working directory
+    previous_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            crawler_main.create_database_and_table(database_name="age_db")
+            crawler = crawler_main.Crawler(seed=seed,
+                                           max_crawled_url=max_crawled_url,
+                                           politeness_criterion=0,
+                                           max_url_by_pages=max_url_by_pages,
+                                           explore_sitemaps=False,
+                                           max_url_by_sitemaps=0,
+                                           duplicate_detector=DuplicateDetector() if detect_duplicates else None)
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                crawled = crawler.run()
+            elapsed = time.perf_counter() - start
+        finally:
+            os.chdir(previous_directory)
+            server.shutdown()
+
+    return {
+        "max_crawled_url": max_crawled_url,
+        "max_url_by_pages": max_url_by_pages,
+        "detect_duplicates": detect_duplicates,
+        "n_crawled": len(crawled),
+        "n_near_duplicates": len(crawler.duplicates),
+        "seconds": elapsed,
+        "pages_per_second": len(crawled) / elapsed,
+        "http_requests": MockSiteHandler.n_requests
+    }
+
+### --- ###
+
+
+### Results related ###
+
+def get_git_commit() -> str:
+    """ Current git commit of the project, if any. """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+def save_json(filename : str, data : dict) -> None:
+    with open(filename, 'w') as file:
+        json.dump(data, file, indent=2)
+    return
+
+def load_json(filename : str) -> object:
+    with open(filename, 'r') as json_file:
+        data = json.load(json_file)
+    return data
+
+def flatten(data : object, prefix : str = '') -> dict:
+    """ Flatten nested results into {'a.b.c' : number}, lists being indexed by position. """
+    flat = {}
+    if isinstance(data, dict):
+        items = data.items()
+    elif isinstance(data, list):
+        items = enumerate(data)
+    else:
+        items = []
+    for key, value in items:
+        name = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, bool):
+            continue
+        if isinstance(value, (int, float)):
+            flat[name] = value
+        else:
+            flat.update(flatten(value, name))
+    return flat
+
+def compare(baseline : dict, current : dict, tolerance : float) -> List[str]:
+    """ Compare the numbers of two result files. Return the lines of metrics that
+        changed by more than (tolerance), as a relative change. """
+    baseline_flat = flatten(baseline["results"])
+    current_flat = flatten(current["results"])
+    lines = []
+    for name in sorted(set(baseline_flat) & set(current_flat)):
+        before, after = baseline_flat[name], current_flat[name]
+        if before == 0:
+            continue
+        change = (after - before) / abs(before)
+        if abs(change) > tolerance:
+            lines.append(f"{name} : {before:.6g} -> {after:.6g} ({100 * change:+.1f}%)")
+    return lines
+
+### --- ###
+
+
+def main() -> None:
+
+    #  Parse args
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--synthetic_sizes', '-ss', default="100,1000")
+    parser.add_argument('--tokenizer', '-tk', default="regex")
+    parser.add_argument('--corpus', '-cp', default="crawled_urls.json")
+    parser.add_argument('--corpus_docs', '-cd', default=1000)
+    parser.add_argument('--indexes', '-i', default="h1.pos_index.json,snowballStemmer.title.non_pos_index.json")
+    parser.add_argument('--n_queries', '-nq', default=200)
+    parser.add_argument('--max_query_length', '-mql', default=3)
+    parser.add_argument('--crawler', '-c', default="True")
+    parser.add_argument('--max_crawled_url', '-mcu', default=50)
+    parser.add_argument('--seed', '-s', default=0)
+    parser.add_argument('--output', '-o', default="benchmark_results.json")
+    parser.add_argument('--compare', '-cmp', default="")
+    parser.add_argument('--tolerance', '-t', default=0.1)
+    args = parser.parse_args()
+
+    # Retrieve args
+    synthetic_sizes = [int(size) for size in args.synthetic_sizes.split(',') if size]
+    tokenizer = args.tokenizer
+    corpus_path = os.path.join(INDEX_DIR, args.corpus)
+    corpus_docs = int(args.corpus_docs)
+    indexes = [index for index in args.indexes.split(',') if index]
+    n_queries = int(args.n_queries)
+    max_query_length = int(args.max_query_length)
+    run_crawler = eval(args.crawler)
+    max_crawled_url = int(args.max_crawled_url)
+    seed = int(args.seed)
+
+    print(" --------------------- ")
+    print(" Parameters: ")
+    print(f"synthetic_sizes : {synthetic_sizes}")
+    print(f"tokenizer : {tokenizer}")
+    print(f"corpus : {corpus_path}")
+    print(f"corpus_docs : {corpus_docs}")
+    print(f"indexes : {indexes}")
+    print(f"n_queries : {n_queries}")
+    print(f"max_query_length : {max_query_length}")
+    print(f"crawler : {run_crawler}")
+    print(f"max_crawled_url : {max_crawled_url}")
+    print(" --------------------- ")
+
+    results = {"tokenizer": [], "index_build": [], "query": [], "startup": [], "crawler": []}
+
+    print("Comparing tokenizers ...")
+    results["tokenizer"].append(run_isolated(tokenizer_workload, corpus_path, corpus_docs, seed))
+
+    for n_docs in synthetic_sizes:
+        for positional in [False, True]:
+            print(f"Building {'positional' if positional else 'non positional'} index on {n_docs} synthetic docs ...")
+            results["index_build"].append(run_isolated(build_index_workload, n_docs, positional, False, tokenizer, seed))
+
+    for index in indexes:
+        print(f"Querying {index} ...")
+        results["query"].append(run_isolated(query_workload, os.path.join(INDEX_DIR, index),
+                                             n_queries, max_query_length, 30, seed))
+        print(f"Starting the ranker on {index} (json and compact) ...")
+        # the compact index is built with the same analyzer as the JSON one
+        analyzer_config = load_analyzer_config(os.path.join(INDEX_DIR, index))
+        results["startup"].append(run_isolated(startup_workload, os.path.join(INDEX_DIR, index),
+                                               analyzer_config, "erreur page"))
+        with tempfile.TemporaryDirectory() as directory:
+            compact_path = os.path.join(directory, index[:-len('.json')] + '.cidx')
+            run_isolated(convert_workload, os.path.join(INDEX_DIR, index), compact_path)
+            results["startup"].append(run_isolated(startup_workload, compact_path, analyzer_config, "erreur page"))
+
+    if run_crawler:
+        print("Crawling the local mock website ...")
+        for detect_duplicates in [False, True]:
+            results["crawler"].append(run_isolated(crawler_workload, max_crawled_url, 5, 2 * max_crawled_url,
+                                                   detect_duplicates))
+
+    report = {
+        "date": datetime.now().isoformat(),
+        "git_commit": get_git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": vars(args),
+        "results": results
+    }
+    save_json(filename=args.output, data=report)
+    print(f"Results saved in {args.output}.")
+
+    if args.compare:
+        lines = compare(load_json(args.compare), report, tolerance=float(args.tolerance))
+        print(f"{len(lines)} metrics changed by more than {100 * float(args.tolerance):.0f}% since {args.compare} :")
+        for line in lines:
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import re
+import unicodedata
+from typing import List
+
+from common.instrumentation import Instrumentation
+
+# A token is a run of letters or digits, possibly joined by hyphens (ex : peut-être).
+# Punctuation and apostrophes split tokens, so "erreur," and "l'erreur" both give "erreur".
+TOKEN_PATTERN = re.compile(r"\w+(?:-\w+)*")
+COMBINING_MARKS = re.compile("[\u0300-\u036f]")
+TOKENIZERS = ['regex', 'whitespace', 'nltk']
+
+
+class Analyzer:
+    """
+    Class Analyzer, handle the text analysis chain shared by the index and the ranker :
+    lowercase, optional accent folding, tokenization, optional stemming.
+    An index must be queried with the analyzer it was built with, that is why its
+    configuration is saved with the index (see config).
+    """
+
+    def __init__(self, tokenizer : str = 'regex',
+                       language : str = 'french',
+                       stemming : bool = False,
+                       fold_accents : bool = False,
+                       instrumentation : Instrumentation = None) -> None:
+        """
+        tokenizer : str :: 'regex' (compiled regex, fast), 'whitespace' (str.split) or 'nltk' (word_tokenize).
+        language : str :: Language of the nltk tokenizer and of the stemmer.
+        stemming : bool :: True to stem tokens (snowball stemmer), False otherwise.
+        fold_accents : bool :: True to remove accents (é -> e), False otherwise.
+        instrumentation : Instrumentation :: Per stage timers and counters (disabled if None).
+        """
+        if tokenizer not in TOKENIZERS:
+            raise ValueError(f"Unknown tokenizer {tokenizer}, choose among {TOKENIZERS}.")
+        self.tokenizer = tokenizer
+        self.language = language
+        self.stemming = stemming
+        self.fold_accents = fold_accents
+        self.instrumentation = instrumentation or Instrumentation(namespace='analyzer')
+        self.stemmer = None
+        # stemming is the slowest step, and a corpus has far less distinct tokens than tokens
+        self.stem_cache = {}
+
+        if tokenizer == 'nltk':
+            # nltk is only needed by the nltk tokenizer and by stemming
+            from nltk import word_tokenize
+            self.word_tokenize = word_tokenize
+
+    #################################### Configuration related methods ################################
+
+    def config(self) -> dict:
+        """ Return the configuration of the analyzer, saved with an index. """
+        return {
+            "tokenizer": self.tokenizer,
+            "language": self.language,
+            "stemming": self.stemming,
+            "fold_accents": self.fold_accents
+        }
+
+    @classmethod
+    def from_config(cls, config : dict, instrumentation : Instrumentation = None) -> 'Analyzer':
+        """ Build the analyzer described by a configuration. """
+        return cls(instrumentation=instrumentation, **config)
+
+    #######################################################################################################
+
+    #################################### Analysis related methods #####################################
+
+    def normalize(self, content : str) -> str:
+        """ Lowercase and, if needed, fold accents. """
+        content = content.lower()
+        if self.fold_accents:
+            content = COMBINING_MARKS.sub('', unicodedata.normalize('NFKD', content))
+        return content
+
+    def tokenize(self, content : str) -> List[str]:
+        """ Given a string, return the string normalized and tokenized (never stemmed). """
+        with self.instrumentation.stage('tokenize'):
+            content = self.normalize(content)
+            if self.tokenizer == 'regex':
+                tokens = TOKEN_PATTERN.findall(content)
+            elif self.tokenizer == 'whitespace':
+                tokens = content.split()
+            else:
+                tokens = self.word_tokenize(content, language=self.language)
+        self.instrumentation.count('tokens', len(tokens))
+        return tokens
+
+    def stem(self, tokens : List[str]) -> List[str]:
+        """ Given tokens, return their stems. """
+        with self.instrumentation.stage('stem'):
+            if self.stemmer is None:
+                from nltk.stem import SnowballStemmer
+                self.stemmer = SnowballStemmer(self.language)
+            stem_cache = self.stem_cache
+            stems = []
+            for token in tokens:
+                stem = stem_cache.get(token)
+                if stem is None:
+                    stem = stem_cache[token] = self.stemmer.stem(token)
+                stems.append(stem)
+        return stems
+
+    def analyze(self, content : str) -> List[str]:
+        """ Given a string, return its terms : tokens, stemmed if the analyzer stems. """
+        tokens = self.tokenize(content)
+        if self.stemming:
+            return self.stem(tokens)
+        return tokens
+
+    def tokenize_many(self, contents : List[str]) -> List[List[str]]:
+        """ Tokenize a batch of strings, one string at a time. """
+        return [self.tokenize(content) for content in contents]
+
+    def analyze_many(self, contents : List[str]) -> List[List[str]]:
+        """ Analyze a batch of strings (see tokenize_many). """
+        tokens_by_content = self.tokenize_many(contents)
+        if self.stemming:
+            return [self.stem(tokens) for tokens in tokens_by_content]
+        return tokens_by_content
+
+    #######################################################################################################
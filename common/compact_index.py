@@ -0,0 +1,276 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import argparse
+from array import array
+from bisect import bisect_left
+from typing import Iterator, List
+
+MAGIC = b'CIDX'
+VERSION = 1
+# magic, version, header length
+PREAMBLE = struct.Struct('<4sII')
+# 'I' is an unsigned int on 4 bytes on every supported platform
+ITEM_SIZE = array('I').itemsize
+
+
+class PostingList:
+    """
+    Postings of a term, with integer doc ids. doc_ids is sorted. For a positional index,
+    the positions of doc_ids[i] are positions[offsets[i]:offsets[i+1]]. For a non positional
+    index, offsets and positions are None.
+    """
+    __slots__ = ('doc_ids', 'offsets', 'positions')
+
+    def __init__(self, doc_ids : array, offsets : array = None, positions : array = None) -> None:
+        self.doc_ids = doc_ids
+        self.offsets = offsets
+        self.positions = positions
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.doc_ids)
+
+    def __contains__(self, doc : int) -> bool:
+        return self.find(doc) >= 0
+
+    def find(self, doc : int) -> int:
+        """ Rank of doc in doc_ids, -1 if the term is not in doc. """
+        i = bisect_left(self.doc_ids, doc)
+        if i < len(self.doc_ids) and self.doc_ids[i] == doc:
+            return i
+        return -1
+
+    def count(self, doc : int) -> int:
+        """ Number of occurrences of the term in doc. A non positional index only knows
+            that the term is in doc, so the count is 1. """
+        i = self.find(doc)
+        if i < 0:
+            return 0
+        if self.offsets is None:
+            return 1
+        return self.offsets[i+1] - self.offsets[i]
+
+    def positions_of(self, doc : int) -> array:
+        """ Positions of the term in doc (empty for a non positional index). """
+        i = self.find(doc)
+        if i < 0 or self.offsets is None:
+            return array('I')
+        return self.positions[self.offsets[i]:self.offsets[i+1]]
+
+    def to_bytes(self) -> bytes:
+        """ Little endian encoding of doc_ids, offsets and positions. """
+        encoded = b''
+        for values in (self.doc_ids, self.offsets, self.positions):
+            if values is not None:
+                if sys.byteorder != 'little':
+                    values = array('I', values)
+                    values.byteswap()
+                encoded += values.tobytes()
+        return encoded
+
+
+def posting_list_from_json(postings : object) -> PostingList:
+    """ Build a PostingList from the postings of a JSON index, which can be :
+        a list of doc ids (non positional index of index/main.py),
+        {doc : [positions]} (positional index of index/main.py),
+        {doc : {'count' : ..., 'positions' : [...]}} (index given to the ranker).
+        Doc ids can be strings, as JSON keys always are. """
+    if isinstance(postings, list):
+        return PostingList(array('I', sorted(int(doc) for doc in postings)))
+
+    offsets = array('I', [0])
+    positions = array('I')
+    doc_ids = array('I')
+    for doc, value in sorted(postings.items(), key=lambda item: int(item[0])):
+        if isinstance(value, dict):
+            value = value['positions']
+        doc_ids.append(int(doc))
+        positions.extend(sorted(value))
+        offsets.append(len(positions))
+    return PostingList(doc_ids, offsets, positions)
+
+
+class CompactIndex:
+    """
+    Class CompactIndex, an inverted index with integer doc ids and array('I') postings.
+    Once saved, the index is loaded lazily : only the term dictionary is read at startup,
+    the postings of a term are read from the memory mapped file the first time the
+    term is requested.
+
+    File layout : magic, version, header length, JSON header, postings. The header stores
+    whether the index is positional and, for each term, [offset, number of docs, number of
+    positions] of its postings.
+    """
+    __slots__ = ('positional', 'terms', 'cache', 'buffer', 'file', 'metadata')
+
+    def __init__(self, positional : bool, terms : dict, cache : dict,
+                 buffer : object = None, file : object = None, metadata : dict = None) -> None:
+        self.positional = positional
+        self.terms = terms
+        self.cache = cache
+        self.buffer = buffer
+        self.file = file
+        self.metadata = metadata or {}
+
+    #################################### Build and load related methods ###############################
+
+    @classmethod
+    def from_dict(cls, index : dict, metadata : dict = None) -> 'CompactIndex':
+        """ Build a CompactIndex from a JSON index (see posting_list_from_json). """
+        cache = {term: posting_list_from_json(postings) for term, postings in index.items()}
+        positional = any(posting_list.offsets is not None for posting_list in cache.values())
+        if positional:
+            # a posting list without positions in a positional index has no occurrence
+            for posting_list in cache.values():
+                if posting_list.offsets is None:
+                    posting_list.offsets = array('I', [0] * (len(posting_list) + 1))
+                    posting_list.positions = array('I')
+        terms = {term: None for term in cache}
+        return cls(positional=positional, terms=terms, cache=cache, metadata=metadata)
+
+    @classmethod
+    def load(cls, filename : str) -> 'CompactIndex':
+        """ Open a saved CompactIndex. Postings are not read until they are requested. """
+        file = open(filename, 'rb')
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_length = PREAMBLE.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            buffer.close()
+            file.close()
+            raise ValueError(f"{filename} is not a compact index (version {VERSION}).")
+        header = json.loads(buffer[PREAMBLE.size:PREAMBLE.size + header_length])
+        start = PREAMBLE.size + header_length
+        terms = {term: (start + offset, n_docs, n_positions)
+                 for term, (offset, n_docs, n_positions) in header['terms'].items()}
+        return cls(positional=header['positional'], terms=terms, cache={},
+                   buffer=buffer, file=file, metadata=header.get('metadata'))
+
+    def save(self, filename : str) -> None:
+        """ Save the index in the compact format. """
+        header_terms = {}
+        blocks = []
+        offset = 0
+        for term in self.terms:
+            posting_list = self.get(term)
+            block = posting_list.to_bytes()
+            n_positions = len(posting_list.positions) if self.positional else 0
+            header_terms[term] = [offset, len(posting_list), n_positions]
+            blocks.append(block)
+            offset += len(block)
+        header = json.dumps({"positional": self.positional,
+                             "metadata": self.metadata,
+                             "terms": header_terms}, separators=(',', ':')).encode()
+        with open(filename, 'wb') as file:
+            file.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+            file.write(header)
+            for block in blocks:
+                file.write(block)
+        return
+
+    def close(self) -> None:
+        """ Release the memory mapped file, if any. """
+        if self.buffer is not None:
+            self.buffer.close()
+            self.file.close()
+            self.buffer = None
+            self.file = None
+
+    #######################################################################################################
+
+    #################################### Access related methods #######################################
+
+    def read(self, term : str) -> PostingList:
+        """ Decode the postings of a term from the memory mapped file. """
+        start, n_docs, n_positions = self.terms[term]
+        n_items = [n_docs]
+        if self.positional:
+            n_items += [n_docs + 1, n_positions]
+        arrays = []
+        for n in n_items:
+            values = array('I')
+            values.frombytes(self.buffer[start:start + n * ITEM_SIZE])
+            if sys.byteorder != 'little':
+                values.byteswap()
+            arrays.append(values)
+            start += n * ITEM_SIZE
+        return PostingList(*arrays)
+
+    def get(self, term : str) -> PostingList:
+        """ Postings of a term, None if the term is not in the index. """
+        posting_list = self.cache.get(term)
+        if posting_list is None:
+            if term not in self.terms:
+                return None
+            posting_list = self.cache[term] = self.read(term)
+        return posting_list
+
+    def __getitem__(self, term : str) -> PostingList:
+        posting_list = self.get(term)
+        if posting_list is None:
+            raise KeyError(term)
+        return posting_list
+
+    def __contains__(self, term : str) -> bool:
+        return term in self.terms
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def keys(self) -> List[str]:
+        return self.terms.keys()
+
+    #######################################################################################################
+
+
+def load_analyzer_config(filename : str) -> dict:
+    """ The analyzer configuration of a JSON index (ex : h1.pos_index.json), read from
+        its sidecar file (h1.pos_index.analyzer.json). None if there is no sidecar file. """
+    analyzer_filename = filename[:-len('.json')] + '.analyzer.json'
+    if not filename.endswith('.json') or not os.path.exists(analyzer_filename):
+        return None
+    with open(analyzer_filename, 'r') as json_file:
+        return json.load(json_file)
+
+def prefer_compact_index(filename : str) -> str:
+    """ Given the filename of a JSON index, return the filename of the compact index saved next
+        to it (ex : h1.pos_index.cidx) if it exists and is not older than the JSON index, which
+        is much faster to load. Return filename otherwise. """
+    compact_filename = filename[:-len('.json')] + '.cidx'
+    if (filename.endswith('.json') and os.path.exists(compact_filename)
+            and os.path.getmtime(compact_filename) >= os.path.getmtime(filename)):
+        return compact_filename
+    return filename
+
+def load_index(filename : str) -> CompactIndex:
+    """ Load an index, lazily if it is a compact index (.cidx), from JSON otherwise.
+        The analyzer configuration of a JSON index is read from its sidecar file, if any
+        (see load_analyzer_config). """
+    if filename.endswith('.cidx'):
+        return CompactIndex.load(filename)
+    with open(filename, 'r') as json_file:
+        index = CompactIndex.from_dict(json.load(json_file))
+    analyzer_config = load_analyzer_config(filename)
+    if analyzer_config is not None:
+        index.metadata["analyzer"] = analyzer_config
+    return index
+
+
+def main() -> None:
+    """ Convert JSON indexes to compact indexes. """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('indexes', nargs='+')
+    args = parser.parse_args()
+
+    for filename in args.indexes:
+        compact_filename = filename[:-len('.json')] + '.cidx' if filename.endswith('.json') else filename + '.cidx'
+        load_index(filename).save(compact_filename)
+        print(f'{compact_filename} saved.')
+
+
+if __name__ == "__main__":
+    main()
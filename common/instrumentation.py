@@ -0,0 +1,235 @@
+import json
+import sys
+import time
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List
+
+
+class NullStage:
+    """ Stage used when instrumentation is disabled : does nothing. """
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+NULL_STAGE = NullStage()
+
+
+class Stage:
+    """ Time a block of code and add the elapsed time to the timer (timer) of an Instrumentation. """
+    __slots__ = ('timer', 'start')
+
+    def __init__(self, timer : list) -> None:
+        self.timer = timer
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+        return None
+
+    def __exit__(self, *exc) -> bool:
+        elapsed = time.perf_counter() - self.start
+        timer = self.timer
+        timer[0] += 1
+        timer[1] += elapsed
+        if elapsed > timer[2]:
+            timer[2] = elapsed
+        return False
+
+
+class Instrumentation:
+    """
+    Class Instrumentation, handle per stage timers, counters and an opt-in sampling profiler.
+    When disabled, stage() returns a shared no-op context manager and count() returns
+    immediately, so instrumented code runs at (almost) full speed.
+    """
+
+    def __init__(self, namespace : str, enabled : bool = False) -> None:
+        """
+        namespace : str :: Prefix of the exported metrics (ex : crawler, index, ranker).
+        enabled : bool :: True to record timers and counters, False otherwise.
+        """
+        self.namespace = namespace
+        self.enabled = enabled
+        # stage name -> [calls, total seconds, max seconds]
+        self.timers = {}
+        self.counters = {}
+        self.samples = Counter()
+        self.profiler = None
+        self.profiler_running = False
+        self.server = None
+
+    #################################### Timers and counters ##########################################
+
+    def stage(self, name : str) -> object:
+        """ Context manager timing the stage (name). """
+        if not self.enabled:
+            return NULL_STAGE
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = [0, 0.0, 0.0]
+        return Stage(timer)
+
+    def count(self, name : str, value : int = 1) -> None:
+        """ Increment the counter (name) by (value). """
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset(self) -> None:
+        """ Forget all recorded timers, counters and samples. """
+        self.timers = {}
+        self.counters = {}
+        self.samples = Counter()
+
+    #######################################################################################################
+
+    #################################### Sampling profiler ############################################
+
+    def start_profiler(self, interval : float = 0.005) -> None:
+        """ Sample the call stack of the calling thread every (interval) secs, in a background thread.
+            Samples are aggregated by stack, in the folded format used by flame graphs. """
+        if self.profiler_running:
+            return
+        target = threading.get_ident()
+        self.profiler_running = True
+
+        def sample() -> None:
+            while self.profiler_running:
+                frame = sys._current_frames().get(target)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_filename.split('/')[-1]}:{code.co_name}")
+                    frame = frame.f_back
+                if stack:
+                    self.samples[';'.join(reversed(stack))] += 1
+                time.sleep(interval)
+
+        self.profiler = threading.Thread(target=sample, daemon=True)
+        self.profiler.start()
+
+    def stop_profiler(self) -> None:
+        """ Stop the sampling profiler. """
+        self.profiler_running = False
+        if self.profiler is not None:
+            self.profiler.join()
+            self.profiler = None
+
+    def top_stacks(self, n : int = 20) -> List[dict]:
+        """ The (n) most sampled stacks. """
+        return [{"stack": stack, "samples": samples} for stack, samples in self.samples.most_common(n)]
+
+    #######################################################################################################
+
+    #################################### Export related methods #######################################
+
+    def to_dict(self) -> dict:
+        """ Return a dictionary containing all the recorded metrics. """
+        return {
+            "namespace": self.namespace,
+            "stages": {name: {"calls": calls, "total_seconds": total, "max_seconds": maximum,
+                              "mean_seconds": total / calls if calls else 0.0}
+                       for name, (calls, total, maximum) in self.timers.items()},
+            "counters": dict(self.counters),
+            "profile": self.top_stacks()
+        }
+
+    def to_prometheus(self) -> str:
+        """ Return the recorded metrics in the Prometheus text exposition format. """
+        prefix = self.namespace
+        lines = [f"# TYPE {prefix}_stage_calls_total counter"]
+        timers = list(self.timers.items())
+        for name, (calls, _, _) in timers:
+            lines.append(f'{prefix}_stage_calls_total{{stage="{name}"}} {calls}')
+        lines.append(f"# TYPE {prefix}_stage_seconds_total counter")
+        for name, (_, total, _) in timers:
+            lines.append(f'{prefix}_stage_seconds_total{{stage="{name}"}} {total}')
+        lines.append(f"# TYPE {prefix}_stage_max_seconds gauge")
+        for name, (_, _, maximum) in timers:
+            lines.append(f'{prefix}_stage_max_seconds{{stage="{name}"}} {maximum}')
+        for name, value in list(self.counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        return '\n'.join(lines) + '\n'
+
+    def save(self, filename : str) -> None:
+        """ Save the metrics in (filename) : Prometheus text format if it ends with .prom,
+            JSON otherwise. """
+        with open(filename, 'w') as file:
+            if filename.endswith('.prom'):
+                file.write(self.to_prometheus())
+            else:
+                json.dump(self.to_dict(), file, indent=2)
+        return
+
+    def save_profile(self, filename : str) -> None:
+        """ Save the profiler samples in the folded format (one 'stack count' per line). """
+        with open(filename, 'w') as file:
+            for stack, samples in self.samples.most_common():
+                file.write(f"{stack} {samples}\n")
+        return
+
+    def serve_prometheus(self, port : int) -> None:
+        """ Serve the metrics on http://0.0.0.0:(port)/metrics, in a background thread. """
+        instrumentation = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = instrumentation.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format : str, *args) -> None:
+                return
+
+        self.server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        """ Stop the profiler and the Prometheus endpoint, if any. """
+        self.stop_profiler()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    #######################################################################################################
+
+
+def setup_instrumentation(namespace : str,
+                          metrics : str,
+                          prometheus_port : int,
+                          profile : str) -> Instrumentation:
+    """ Build the Instrumentation of a main() from its args. Instrumentation is enabled if
+        a metrics file, a Prometheus port or a profile file is given. """
+    instrumentation = Instrumentation(namespace=namespace,
+                                      enabled=bool(metrics or prometheus_port or profile))
+    if prometheus_port:
+        instrumentation.serve_prometheus(prometheus_port)
+        print(f"Metrics served on http://0.0.0.0:{prometheus_port}/metrics")
+    if profile:
+        instrumentation.start_profiler()
+    return instrumentation
+
+def teardown_instrumentation(instrumentation : Instrumentation, metrics : str, profile : str) -> None:
+    """ Save the metrics and the profile of a main(), then stop the instrumentation. """
+    instrumentation.stop_profiler()
+    if metrics:
+        instrumentation.save(metrics)
+        print(f"Metrics saved in {metrics}.")
+    if profile:
+        instrumentation.save_profile(profile)
+        print(f"Profile saved in {profile}.")
+    instrumentation.close()
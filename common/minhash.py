@@ -0,0 +1,130 @@
+import random
+from hashlib import blake2b
+from typing import List, Set, Tuple
+
+from common.analyzer import Analyzer
+
+
+def hash_shingle(shingle : str) -> int:
+    """ 64 bits hash of a shingle, stable between runs (unlike hash()). """
+    return int.from_bytes(blake2b(shingle.encode(), digest_size=8).digest(), 'little')
+
+def get_shingles(tokens : List[str], size : int) -> Set[int]:
+    """ Hashes of the distinct (size) consecutive tokens of a document.
+        A document shorter than (size) tokens has a single shingle. """
+    if len(tokens) < size:
+        return {hash_shingle(' '.join(tokens))} if tokens else set()
+    return {hash_shingle(' '.join(tokens[i:i + size])) for i in range(len(tokens) - size + 1)}
+
+
+class MinHash:
+    """
+    Class MinHash, compute MinHash signatures. The probability that two signatures agree
+    on a given position is (about) the Jaccard similarity of the two shingle sets.
+    Each hash function XORs the 64 bits shingle hashes with a random mask : it is several times
+    faster in pure Python than (a * x + b) mod p, and good enough as shingle hashes are uniform.
+    """
+
+    def __init__(self, num_perm : int = 64, seed : int = 1) -> None:
+        """
+        num_perm : int :: Number of hash functions, i.e. length of the signatures.
+        seed : int :: Seed of the hash functions. Signatures are only comparable with the same seed.
+        """
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.masks = [rng.getrandbits(64) for _ in range(num_perm)]
+
+    def signature(self, shingles : Set[int]) -> Tuple[int]:
+        """ MinHash signature of a set of shingles. """
+        shingles = list(shingles)
+        return tuple(min([shingle ^ mask for shingle in shingles]) for mask in self.masks)
+
+    @staticmethod
+    def similarity(signature : Tuple[int], other : Tuple[int]) -> float:
+        """ Estimated Jaccard similarity of the documents of two signatures. """
+        return sum(1 for x, y in zip(signature, other) if x == y) / len(signature)
+
+
+class LSHIndex:
+    """
+    Class LSHIndex, find candidate near-duplicates without comparing a signature to all the others.
+    Signatures are cut into (bands) bands of (rows) rows, two signatures are candidates if they
+    are equal on at least one band. With b bands of r rows, documents of Jaccard similarity s
+    are candidates with probability 1 - (1 - s^r)^b.
+    """
+
+    def __init__(self, bands : int, rows : int) -> None:
+        self.bands = bands
+        self.rows = rows
+        self.buckets = [dict() for _ in range(bands)]
+        self.signatures = {}
+
+    def insert(self, key : object, signature : Tuple[int]) -> None:
+        """ Add a signature to the index. """
+        self.signatures[key] = signature
+        for band, buckets in enumerate(self.buckets):
+            buckets.setdefault(signature[band * self.rows:(band + 1) * self.rows], []).append(key)
+
+    def candidates(self, signature : Tuple[int]) -> List[object]:
+        """ Keys of the signatures sharing at least one band with signature, in insertion order. """
+        candidates = {}
+        for band, buckets in enumerate(self.buckets):
+            for key in buckets.get(signature[band * self.rows:(band + 1) * self.rows], []):
+                candidates[key] = None
+        return list(candidates)
+
+
+class DuplicateDetector:
+    """
+    Class DuplicateDetector, handle all the logic of near-duplicate detection : shingling,
+    MinHash signatures and LSH banding. The first document of a group of near-duplicates is
+    its canonical document.
+    """
+
+    def __init__(self, threshold : float = 0.8,
+                       num_perm : int = 64,
+                       bands : int = 8,
+                       shingle_size : int = 3,
+                       analyzer : Analyzer = None) -> None:
+        """
+        threshold : float :: Minimum estimated Jaccard similarity of two near-duplicates.
+        num_perm : int :: Length of the MinHash signatures.
+        bands : int :: Number of LSH bands, num_perm has to be a multiple of bands. With the defaults
+                       (8 bands of 8 rows), pages with a similarity of 0.8 are candidates with probability 0.97.
+        shingle_size : int :: Number of consecutive tokens of a shingle.
+        analyzer : Analyzer :: Tokenize documents before shingling (default : regex tokenizer).
+        """
+        if num_perm % bands != 0:
+            raise ValueError(f"num_perm ({num_perm}) has to be a multiple of bands ({bands}).")
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.analyzer = analyzer or Analyzer()
+        self.minhash = MinHash(num_perm=num_perm)
+        self.lsh = LSHIndex(bands=bands, rows=num_perm // bands)
+
+    def signature(self, content : str) -> Tuple[int]:
+        """ MinHash signature of a document, None if the document has no token. """
+        shingles = get_shingles(self.analyzer.tokenize(content), self.shingle_size)
+        if len(shingles) == 0:
+            return None
+        return self.minhash.signature(shingles)
+
+    def find_duplicate(self, signature : Tuple[int]) -> object:
+        """ Key of the first added document which is a near-duplicate of signature, None otherwise. """
+        for key in self.lsh.candidates(signature):
+            if MinHash.similarity(signature, self.lsh.signatures[key]) >= self.threshold:
+                return key
+        return None
+
+    def add(self, key : object, content : str) -> object:
+        """ Return the canonical key of a document : the key of an already added near-duplicate
+            if there is one, (key) otherwise, in which case the document is added. Documents
+            without tokens are never considered as duplicates. """
+        signature = self.signature(content)
+        if signature is None:
+            return key
+        duplicate = self.find_duplicate(signature)
+        if duplicate is not None:
+            return duplicate
+        self.lsh.insert(key, signature)
+        return key
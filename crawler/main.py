@@ -12,6 +12,12 @@ import requests
 import argparse
 import hashlib
 import re
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.instrumentation import Instrumentation, setup_instrumentation, teardown_instrumentation
+from common.minhash import DuplicateDetector
 
 class Crawler:
     """
@@ -24,7 +30,9 @@ class Crawler:
                  politeness_criterion : float,
                  max_url_by_pages : int,
                  explore_sitemaps : bool,
-                 max_url_by_sitemaps : int) -> None:
+                 max_url_by_sitemaps : int,
+                 instrumentation : Instrumentation = None,
+                 duplicate_detector : DuplicateDetector = None) -> None:
         """
         seed : str :: Seed url
         max_crawled_url : int :: Maximum number of crawled pages.
@@ -32,6 +40,8 @@ class Crawler:
         max_url_by_pages : int :: Maximum links to add in frontier for each webpages.
         explore_sitemaps : bool :: True if you want to explore sitemaps, False otherwise.
         max_url_by_sitemaps : int :: Maximum urls to add in frontier for urls in sitemaps.
+        instrumentation : Instrumentation :: Per stage timers and counters (disabled if None).
+        duplicate_detector : DuplicateDetector :: If given, links of near-duplicate pages are not explored.
         """
         self.seed = seed
         self.crawled = set([seed])
@@ -41,25 +51,52 @@ class Crawler:
         self.max_url_by_pages = max_url_by_pages
         self.explore_sitemaps = explore_sitemaps
         self.max_url_by_sitemaps = max_url_by_sitemaps
+        self.instrumentation = instrumentation or Instrumentation(namespace='crawler')
+        self.duplicate_detector = duplicate_detector
+        # near-duplicate url -> url of the first crawled page with the same content
+        self.duplicates = {}
 
 
     def parse_html(self, url : str) -> List[str]:
         """ Given an url, get all the links on a webpage. """
         links = []
         try:
-            response = urllib.request.urlopen(url)
-            html = response.read()
-            parsed_html = BeautifulSoup(html, 'html.parser')
-            anchor_tags = parsed_html.find_all('a')
-            for tag in anchor_tags:
-                href = tag.get('href')
-                if href and href.startswith("http"):
-                    links.append(href)
+            with self.instrumentation.stage('fetch'):
+                response = urllib.request.urlopen(url)
+                html = response.read()
+            self.instrumentation.count('pages_fetched')
+            with self.instrumentation.stage('parse'):
+                parsed_html = BeautifulSoup(html, 'html.parser')
+                text = parsed_html.get_text(' ') if self.duplicate_detector is not None else ''
+                anchor_tags = parsed_html.find_all('a')
+                for tag in anchor_tags:
+                    href = tag.get('href')
+                    if href and href.startswith("http"):
+                        links.append(href)
+            # Links of a near-duplicate page (pagination, tracking parameters, print view ...) are
+            # most likely the links of the original page, so we do not explore them again
+            if self.is_near_duplicate(url=url, text=text):
+                links = []
         except:
+            self.instrumentation.count('fetch_errors')
             links = []
 
+        self.instrumentation.count('links_found', len(links))
         return links
     
+    def is_near_duplicate(self, url : str, text : str) -> bool:
+        """ Check if the text of the webpage at url is a near-duplicate of an already parsed webpage.
+            Always False if the crawler has no duplicate detector. """
+        if self.duplicate_detector is None:
+            return False
+        with self.instrumentation.stage('dedup'):
+            canonical_url = self.duplicate_detector.add(url, text)
+        if canonical_url == url:
+            return False
+        self.duplicates[url] = canonical_url
+        self.instrumentation.count('near_duplicates')
+        return True
+
     def get_robots_path(self, url : str) -> List[str]:
         """ Given an url, give the robots.txt path. """
         parsed_url = urlparse(url)
@@ -68,10 +105,11 @@ class Crawler:
 
     def is_url_allowed_by_robots(self, url : str, url_robot : str) -> bool:
         """ Check if an url is crawlable. Need to specify robots.txt path. """ 
-        rp = urllib.robotparser.RobotFileParser(url_robot)
-        rp.set_url(url_robot)
-        rp.read()
-        return rp.can_fetch("*", url)
+        with self.instrumentation.stage('robots'):
+            rp = urllib.robotparser.RobotFileParser(url_robot)
+            rp.set_url(url_robot)
+            rp.read()
+            return rp.can_fetch("*", url)
 
     def get_n_allowed_url_in_border(self,
                                     main_url : str,
@@ -97,7 +135,8 @@ class Crawler:
         """ Given the path of a robots.txt, get all xml links (sitemaps). """
         try:
             # Make an HTTP request to get the robots.txt content
-            response = requests.get(url_robots)
+            with self.instrumentation.stage('robots'):
+                response = requests.get(url_robots)
             response.raise_for_status()  # Raise an exception for bad responses
             # Extract sitemap links using a regular expression
             sitemap_links = re.findall(r'Sitemap:\s*(.*?)(?:\r?\n|$)', response.text, re.IGNORECASE)
@@ -108,10 +147,12 @@ class Crawler:
     def get_links_in_sitemaps_from_url(self, url : str) -> List[str]:
         """ Given an url (.xml), get all the links on a sitemap by parsing the xml. """
         try:
-            https = urllib3.PoolManager()
-            response = https.request('GET', url)
-            sitemap = xmltodict.parse(response.data)
-            links = [link['loc'] for link in sitemap['urlset']['url']]
+            with self.instrumentation.stage('fetch'):
+                https = urllib3.PoolManager()
+                response = https.request('GET', url)
+            with self.instrumentation.stage('parse'):
+                sitemap = xmltodict.parse(response.data)
+                links = [link['loc'] for link in sitemap['urlset']['url']]
             return links
         except Exception as e:
             return [] 
@@ -181,7 +222,9 @@ class Crawler:
                 self.crawled.add(url)
 
                 # Update age of the pages (in an SQL database)
-                update_age("age_db", url)
+                with self.instrumentation.stage('db_write'):
+                    update_age("age_db", url)
+                self.instrumentation.count('pages_crawled')
 
                 self.display_info()
 
@@ -248,6 +291,11 @@ def main() -> None:
     parser.add_argument('--max_url_by_pages', '-mbp', default=5)
     parser.add_argument('--explore_sitemaps', '-es', default="False")
     parser.add_argument('--max_url_by_sitemaps', '-mbs', default=0)
+    parser.add_argument('--detect_duplicates', '-dd', default="False")
+    parser.add_argument('--duplicate_threshold', '-dt', default=0.8)
+    parser.add_argument('--metrics', '-mf', default="")
+    parser.add_argument('--prometheus_port', '-pp', default=0)
+    parser.add_argument('--profile', '-pf', default="")
     args = parser.parse_args()
 
     # Retrieve args
@@ -257,6 +305,11 @@ def main() -> None:
     max_url_by_pages = int(args.max_url_by_pages)
     explore_sitemaps = eval(args.explore_sitemaps)
     max_url_by_sitemaps = int(args.max_url_by_sitemaps)
+    detect_duplicates = eval(args.detect_duplicates)
+    duplicate_threshold = float(args.duplicate_threshold)
+    metrics = args.metrics
+    prometheus_port = int(args.prometheus_port)
+    profile = args.profile
     
     print(" --------------------- ")
     print(" Parameters: ")
@@ -266,17 +319,29 @@ def main() -> None:
     print(f"max_url_by_pages : {max_url_by_pages}")
     print(f"explore_sitemaps : {explore_sitemaps}")  
     print(f"max_url_by_sitemaps : {max_url_by_sitemaps}")  
+    print(f"detect_duplicates : {detect_duplicates}")
+    print(f"duplicate_threshold : {duplicate_threshold}")
+    print(f"metrics : {metrics}")
+    print(f"prometheus_port : {prometheus_port}")
+    print(f"profile : {profile}")
     print(" --------------------- ")
     
     print("Crawler is setting up ...")
 
+    instrumentation = setup_instrumentation(namespace='crawler',
+                                            metrics=metrics,
+                                            prometheus_port=prometheus_port,
+                                            profile=profile)
+
     # init the crawler
     crawler = Crawler(seed = seed, 
                       max_crawled_url = max_crawled_url,
                       politeness_criterion = politeness_criterion,
                       max_url_by_pages = max_url_by_pages,
                       explore_sitemaps = explore_sitemaps,
-                      max_url_by_sitemaps = max_url_by_sitemaps)
+                      max_url_by_sitemaps = max_url_by_sitemaps,
+                      instrumentation = instrumentation,
+                      duplicate_detector = DuplicateDetector(threshold=duplicate_threshold) if detect_duplicates else None)
 
     # Crawl
     crawled = crawler.run()
@@ -284,5 +349,7 @@ def main() -> None:
     # save the result in crawled_webpages.txt
     save(crawled)
 
+    teardown_instrumentation(instrumentation, metrics=metrics, profile=profile)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,53 +1,92 @@
 import json
-from typing import List, Tuple
-import nltk
-from nltk import word_tokenize
-import re
+from typing import List, Tuple, Iterator
 import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.instrumentation import Instrumentation, setup_instrumentation, teardown_instrumentation
+from common.compact_index import CompactIndex
+from common.analyzer import Analyzer
+from common.minhash import DuplicateDetector
 
 class Tokenizer:
     """ Class Tokenizer, handle all the logic of tokenization """
-    def __init__(self, language : str = 'french') -> None:
+    def __init__(self, language : str = 'french',
+                       instrumentation : Instrumentation = None,
+                       mode : str = 'nltk',
+                       fold_accents : bool = False) -> None:
+        """
+        mode is the tokenizer of the analyzer : 'nltk' (word_tokenize), 'regex' (much faster) or 'whitespace'
+        fold_accents is True to remove accents from tokens
+        """
         self.language = language
-        self.stemmer = nltk.stem.SnowballStemmer(language)
+        self.analyzer = Analyzer(tokenizer=mode,
+                                 language=language,
+                                 fold_accents=fold_accents,
+                                 instrumentation=instrumentation)
 
     def tokenize(self, content : str) -> List[str]:
         """ Given a string, return the string tokenized. """
-        content = content.lower()
-        return word_tokenize(content, language=self.language)
+        return self.analyzer.tokenize(content)
 
     def stemmerize(self, content : str) -> List[str]:
         """ Given a string, return the string stemmerized. """
-        content = content.lower()
-        tokens = self.tokenize(content)
-        stems = []
-        for token in tokens:
-            stems += [self.stemmer.stem(token)]
-        return stems
+        return self.analyzer.stem(self.analyzer.tokenize(content))
+
+    def analyze_many(self, contents : List[str], stemmerize : bool) -> List[List[str]]:
+        """ Given a batch of strings, return each string tokenized, or stemmerized if stemmerize is True. """
+        tokens_by_content = self.analyzer.tokenize_many(contents)
+        if stemmerize:
+            return [self.analyzer.stem(tokens) for tokens in tokens_by_content]
+        return tokens_by_content
+
+    def get_analyzer_config(self, stemmerize : bool) -> dict:
+        """ Configuration of the analyzer an index is built with. The ranker has to analyze
+            requests the same way. """
+        config = self.analyzer.config()
+        config["stemming"] = stemmerize
+        return config
 
 
 class Index:
     """ Class Index, handle all the logic for indexation. """
     def __init__(self, crawled : List[dict], 
                        tokenizer : Tokenizer,
-                       fields : List[str]):
+                       fields : List[str],
+                       instrumentation : Instrumentation = None,
+                       batch_size : int = 256,
+                       duplicate_detector : DuplicateDetector = None):
         """ 
         crawled is a list of dictionnary
         tokenizer is a Tokenizer instance
         field is the fields of interests in crawled dictionnaries
+        instrumentation records per stage timers and counters (disabled if None)
+        batch_size is the number of documents analyzed at once during indexation
+        duplicate_detector, if given, collapses near-duplicate documents into their canonical document
         """
         self.crawled = crawled
         self.tokenizer = tokenizer
         self.fields = fields
+        self.batch_size = batch_size
+        self.duplicate_detector = duplicate_detector
+        self.duplicates = None
+        self.instrumentation = instrumentation or Instrumentation(namespace='index')
         self.non_positional_index = [dict() for i in range(len(fields))]
         self.positional_index = [dict() for i in range(len(fields))]
 
 
     #################################### Metadata related methods #####################################
 
+    def get_indexed_documents(self) -> List[dict]:
+        """ Get the documents which are indexed : all the crawled documents but the
+            near-duplicates, which are collapsed into their canonical document. """
+        duplicates = self.get_duplicates()
+        return [document for doc_index, document in enumerate(self.crawled) if doc_index not in duplicates]
+
     def get_number_doc(self) -> int:
-        """ Get the number of documents. """
-        return len(self.crawled)
+        """ Get the number of indexed documents. """
+        return len(self.get_indexed_documents())
 
     def tokenize(self, content : str) -> List[str]:
         """ Tokenize a given string. """
@@ -74,14 +113,14 @@ class Index:
         return total_by_doc
         
     def get_global_number_token(self) -> int:
-        """ Count the total number of tokens in all documents. """
+        """ Count the total number of tokens in all indexed documents. """
         total = 0
-        for document in self.crawled:
+        for document in self.get_indexed_documents():
             total += self.get_number_token_by_doc(document=document)
         return total
 
     def get_global_token_by_field(self) -> List[int]:
-        """ Count the total number of tokens in all documents for each field. 
+        """ Count the total number of tokens in all indexed documents for each field. 
             The result is sorted according to the order of the fields list.
             For example, if the fields list is ['a', 'b'], then the returned
             list (total) will store in first position the total number for field 'a'
@@ -89,14 +128,15 @@ class Index:
 
         total = [0]*len(self.fields)
 
-        for document in self.crawled:
+        for document in self.get_indexed_documents():
             for i, field in enumerate(self.fields):
                 total[i] += self.get_number_token_by_field_by_doc(document=document, field=field)
 
         return total
 
     def get_metadata(self):
-        """ Return a dictionary containing metadata of the crawled urls. """
+        """ Return a dictionary containing metadata of the indexed documents. With a duplicate
+            detector, near-duplicates are not counted, as they are not in the index. """
        
         metadata = {
             "number_doc": self.get_number_doc(),
@@ -109,12 +149,47 @@ class Index:
             metadata["global_token_by_" + field] = global_token_by_field[i]
             metadata["average_token_by_" + field] = global_token_by_field[i]/self.get_number_doc()
 
+        if self.duplicate_detector is not None:
+            metadata["number_crawled_doc"] = len(self.crawled)
+            metadata["number_near_duplicate_doc"] = len(self.get_duplicates())
+
         return metadata
 
+    def get_duplicates(self) -> dict:
+        """ Return a dictionary near-duplicate doc index -> canonical doc index, the canonical document
+            being the first document of a group of near-duplicates (MinHash over all the fields).
+            Empty if the index has no duplicate detector. Computed once. """
+        if self.duplicates is None:
+            self.duplicates = {}
+            if self.duplicate_detector is not None:
+                for doc_index, document in enumerate(self.crawled):
+                    with self.instrumentation.stage('dedup'):
+                        content = ' '.join(document[field] for field in self.fields)
+                        canonical_doc_index = self.duplicate_detector.add(doc_index, content)
+                    if canonical_doc_index != doc_index:
+                        self.duplicates[doc_index] = canonical_doc_index
+        return self.duplicates
+
 
     #######################################################################################################
 
     #################################### non positional indexation related methods #################################
+
+    def get_entities_by_batch(self, stemmerize : bool) -> Iterator[Tuple[int, int, List[str]]]:
+        """ Yield (doc_index, index_field, entities) for each document and field, in the order of
+            the documents. Documents are analyzed by batches of self.batch_size. If stemmerize is True, entities are stems, tokens otherwise.
+            Near-duplicate documents are skipped : they are collapsed into their canonical document. """
+        duplicates = self.get_duplicates()
+        for start in range(0, len(self.crawled), self.batch_size):
+            doc_indexes = [doc_index for doc_index in range(start, min(start + self.batch_size, len(self.crawled)))
+                           if doc_index not in duplicates]
+            entities_by_field = [self.tokenizer.analyze_many([self.crawled[doc_index][field] for doc_index in doc_indexes],
+                                                             stemmerize)
+                                 for field in self.fields]
+            for offset, doc_index in enumerate(doc_indexes):
+                for index_field in range(len(self.fields)):
+                    yield doc_index, index_field, entities_by_field[index_field][offset]
+            self.instrumentation.count('documents', len(doc_indexes))
     
     def get_distinct_stem_by_doc_by_field(self, document : dict, field : str) -> List[str]:
         """ Given a document, returns all distinct stems. """
@@ -135,19 +210,14 @@ class Index:
         and in second position the index of field 'b'. 
         """
 
-        for doc_index, doc in enumerate(self.crawled):
-            for index_field, field in enumerate(self.fields):
-
-                if stemmerize:
-                    # We use a distinct stem version to avoid adding the documents multiple times to a given
-                    # stem key
-                    distinct_entities = self.get_distinct_stem_by_doc_by_field(document=doc,field=field)
-                else:
-                    # We use a distinct token version to avoid adding the documents multiple times to a given
-                    # token key
-                    distinct_entities = self.get_distinct_token_by_doc_by_field(document=doc,field=field)
-                
-                # entitie represents a token or a stem
+        for doc_index, index_field, entities in self.get_entities_by_batch(stemmerize=stemmerize):
+
+            # We use the distinct tokens (or stems) to avoid adding the documents multiple times to a given
+            # token (or stem) key
+            distinct_entities = set(entities)
+
+            # entitie represents a token or a stem
+            with self.instrumentation.stage('postings_insert'):
                 for entitie in distinct_entities:
                     # if the entitie exists in the index
                     if entitie in self.non_positional_index[index_field]:
@@ -182,14 +252,9 @@ class Index:
         and in second position the index of field 'b'. 
         """
 
-        for doc_index, document in enumerate(self.crawled):
-            for index_field, field in enumerate(self.fields):
+        for doc_index, index_field, entities_by_field in self.get_entities_by_batch(stemmerize=stemmerize):
 
-                if stemmerize:
-                    entities_by_field = self.get_stem_by_doc_by_field(document=document,field=field)
-                else:
-                    entities_by_field = self.get_token_by_doc_by_field(document=document,field=field)
-                
+            with self.instrumentation.stage('postings_insert'):
                 # entitie represents a token or a stem
                 # pos is the position of the token or the stem
                 for pos, entitie in enumerate(entities_by_field):
@@ -226,6 +291,12 @@ def load_json(filename : str) -> object:
         data = json.load(json_file)
     return data
 
+def save_compact(filename : str, data : dict, analyzer_config : dict) -> None:
+    """ Save an index in the compact format (integer doc ids, lazily loaded by the ranker).
+        The configuration of the analyzer is saved in the header of the index. """
+    CompactIndex.from_dict(data, metadata={"analyzer": analyzer_config}).save(filename)
+    return
+
 
 def main() -> None:
     #nltk.download()
@@ -235,29 +306,68 @@ def main() -> None:
     parser.add_argument('--metadata', '-mt', default="True")
     parser.add_argument('--positional_index', '-pi', default="False")
     parser.add_argument('--stemmerize', '-s', default="False")
+    parser.add_argument('--compact', '-c', default="True")
+    parser.add_argument('--tokenizer', '-t', default="nltk")
+    parser.add_argument('--fold_accents', '-fa', default="False")
+    parser.add_argument('--detect_duplicates', '-dd', default="False")
+    parser.add_argument('--duplicate_threshold', '-dt', default=0.8)
+    parser.add_argument('--metrics', '-mf', default="")
+    parser.add_argument('--prometheus_port', '-pp', default=0)
+    parser.add_argument('--profile', '-pf', default="")
     args = parser.parse_args()
 
     # Retrieve args
     metadata = eval(args.metadata)
     positional_index = eval(args.positional_index)
     stemmerize = eval(args.stemmerize)
+    compact = eval(args.compact)
+    tokenizer_mode = args.tokenizer
+    fold_accents = eval(args.fold_accents)
+    detect_duplicates = eval(args.detect_duplicates)
+    duplicate_threshold = float(args.duplicate_threshold)
+    metrics = args.metrics
+    prometheus_port = int(args.prometheus_port)
+    profile = args.profile
     
     print(" --------------------- ")
     print(" Parameters: ")
     print(f"metadata : {metadata}")
     print(f"positional_index : {positional_index}") 
     print(f"stemmerize : {stemmerize}")
+    print(f"compact : {compact}")
+    print(f"tokenizer : {tokenizer_mode}")
+    print(f"fold_accents : {fold_accents}")
+    print(f"detect_duplicates : {detect_duplicates}")
+    print(f"duplicate_threshold : {duplicate_threshold}")
+    print(f"metrics : {metrics}")
+    print(f"prometheus_port : {prometheus_port}")
+    print(f"profile : {profile}")
+
+    instrumentation = setup_instrumentation(namespace='index',
+                                            metrics=metrics,
+                                            prometheus_port=prometheus_port,
+                                            profile=profile)
 
     crawled = load_json(filename='crawled_urls.json')
-    tokenizer = Tokenizer(language='french')
+    tokenizer = Tokenizer(language='french', instrumentation=instrumentation, mode=tokenizer_mode, fold_accents=fold_accents)
+    analyzer_config = tokenizer.get_analyzer_config(stemmerize=stemmerize)
     fields = ["title", "content", "h1"] 
-    index = Index(crawled=crawled, tokenizer=tokenizer, fields=fields)
+    duplicate_detector = DuplicateDetector(threshold=duplicate_threshold) if detect_duplicates else None
+    index = Index(crawled=crawled, tokenizer=tokenizer, fields=fields, instrumentation=instrumentation,
+                  duplicate_detector=duplicate_detector)
+
+    if detect_duplicates:
+        print('Detecting near-duplicates ...')
+        duplicates = index.get_duplicates()
+        save_json(filename="duplicates.json", data=duplicates)
+        print(f'{len(duplicates)} near-duplicates found, saved in duplicates.json.')
     
     if metadata:
         print('Computing statistics ...')
         metadata = index.get_metadata()
         print('Statistics computed.')
-        save_json(filename="metadata.json", data=metadata)
+        with instrumentation.stage('serialize'):
+            save_json(filename="metadata.json", data=metadata)
         print('Computed statistics saved in metadata.json.')
 
 
@@ -267,12 +377,16 @@ def main() -> None:
         print('Positional index created.')
         
         for i, field in enumerate(fields):
-            if stemmerize:
-                save_json(filename=f'snowballStemmer.{field}.pos_index.json', data=positional_indexation[i])
-                print(f'snowballStemmer.{field}.pos_index.json saved.')
-            else:
-                save_json(filename=f'{field}.pos_index.json', data=positional_indexation[i])
-                print(f'{field}.pos_index.json saved.')
+            filename = f'snowballStemmer.{field}.pos_index' if stemmerize else f'{field}.pos_index'
+            with instrumentation.stage('serialize'):
+                save_json(filename=f'{filename}.json', data=positional_indexation[i])
+                # the ranker reads it to analyze requests the same way
+                save_json(filename=f'{filename}.analyzer.json', data=analyzer_config)
+            print(f'{filename}.json saved.')
+            if compact:
+                with instrumentation.stage('serialize'):
+                    save_compact(filename=f'{filename}.cidx', data=positional_indexation[i], analyzer_config=analyzer_config)
+                print(f'{filename}.cidx saved.')
 
     else:
         print('Creating non positional index ...')
@@ -280,12 +394,18 @@ def main() -> None:
         print('Non positional index created.')
         
         for i, field in enumerate(fields):
-            if stemmerize:
-                save_json(filename=f'snowballStemmer.{field}.non_pos_index.json', data=non_positional_indexation[i])
-                print(f'snowballStemmer.{field}.non_pos_index.json saved.')
-            else:
-                save_json(filename=f'{field}.non_pos_index.json', data=non_positional_indexation[i])
-                print(f'{field}.non_pos_index.json saved.')        
+            filename = f'snowballStemmer.{field}.non_pos_index' if stemmerize else f'{field}.non_pos_index'
+            with instrumentation.stage('serialize'):
+                save_json(filename=f'{filename}.json', data=non_positional_indexation[i])
+                # the ranker reads it to analyze requests the same way
+                save_json(filename=f'{filename}.analyzer.json', data=analyzer_config)
+            print(f'{filename}.json saved.')
+            if compact:
+                with instrumentation.stage('serialize'):
+                    save_compact(filename=f'{filename}.cidx', data=non_positional_indexation[i], analyzer_config=analyzer_config)
+                print(f'{filename}.cidx saved.')
+
+    teardown_instrumentation(instrumentation, metrics=metrics, profile=profile)
 
 
 if __name__ == "__main__":
@@ -1,31 +1,55 @@
 import json
 from typing import List
-#import nltk
-#from nltk import word_tokenize
-from collections import Counter
 import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.instrumentation import Instrumentation, setup_instrumentation, teardown_instrumentation
+from common.compact_index import CompactIndex, load_index, prefer_compact_index
+from common.analyzer import Analyzer
 
 
 class Tokenizer:
     """ Class Tokenizer, handle all the logic of tokenization """
-    def __init__(self, language : str = 'french') -> None:
+    def __init__(self, language : str = 'french',
+                       instrumentation : Instrumentation = None,
+                       analyzer : Analyzer = None) -> None:
+        """ analyzer has to be the analyzer the index was built with (default : regex tokenizer, no stemming) """
         self.language = language
+        self.analyzer = analyzer or Analyzer(language=language, instrumentation=instrumentation)
 
     def tokenize(self, content : str) -> List[str]:
-        """ Given a content, return the content tokenized. """
-        # after made some test, I think it is what you have done,
-        # so i put nltk tokenizer in comment
-        tokens = content.split() #word_tokenize(content, language=self.language)
-        tokens = [token.lower() for token in tokens]
-        return tokens
+        """ Given a content, return the content tokenized (and stemmed, if the index is). """
+        return self.analyzer.analyze(content)
 
 
 class Ranker:
 
-    def __init__(self, index : dict, doc : List[dict]) -> None:
-        self.index = index
+    def __init__(self, index : object, doc : List[dict],
+                       instrumentation : Instrumentation = None,
+                       analyzer : Analyzer = None) -> None:
+        """
+        index is a CompactIndex, or a JSON index (dictionary) which is converted to a CompactIndex
+        doc is a list of dictionnary, with integer ids
+        analyzer analyzes the requests. By default, it is the analyzer saved with the index. If the
+        index has a saved analyzer, a different analyzer raises a ValueError, as the requests would
+        not match the terms of the index. If it has none, the analyzer has to be given.
+        """
+        self.index = index if isinstance(index, CompactIndex) else CompactIndex.from_dict(index)
         self.doc = doc
-        self.tokenizer = Tokenizer()
+        self.doc_by_id = {document['id'] : document for document in doc}
+        self.instrumentation = instrumentation or Instrumentation(namespace='ranker')
+
+        index_analyzer_config = self.index.metadata.get("analyzer")
+        if analyzer is None and index_analyzer_config is None:
+            raise ValueError("The index has no saved analyzer, the analyzer it was built with has to be given.")
+        if analyzer is None:
+            analyzer = Analyzer.from_config(index_analyzer_config, instrumentation=self.instrumentation)
+        elif index_analyzer_config is not None and analyzer.config() != index_analyzer_config:
+            raise ValueError(f"The index was built with the analyzer {index_analyzer_config}, "
+                             f"requests cannot be analyzed with {analyzer.config()}.")
+        self.tokenizer = Tokenizer(instrumentation=self.instrumentation, analyzer=analyzer)
     
     def get_doc_that_contains_at_least_one_req_tokens(self, request : str) -> object:
         """ 
@@ -33,29 +57,34 @@ class Ranker:
         the tokenized request. Perform the so called OR request. 
         """
 
-        docs = []
+        docs = set()
         request_tokens = self.tokenizer.tokenize(request)
         
         for token in request_tokens:
-            if token in self.index.keys():
-                docs += self.index[token].keys()
+            posting_list = self.index.get(token)
+            if posting_list is not None:
+                docs.update(posting_list.doc_ids)
         
-        return list(set(docs))
+        return list(docs)
 
     def get_doc_that_contains_exactly_all_req_tokens(self, request : str) -> object:
         """ Given a request, get all docs that contains at all the tokens from
         the tokenized request. Perform the so called AND request. """
-        docs = []
         request_tokens = self.tokenizer.tokenize(request)
-        
-        for token in request_tokens:
-            if token in self.index.keys():
-                docs += self.index[token].keys()
-        
-        occurrences = Counter(docs)
-        filtered_docs = [item for item, count in occurrences.items() if count == len(request_tokens)]
+        posting_lists = [self.index.get(token) for token in request_tokens]
 
-        return filtered_docs
+        # a doc has to be in every posting list, so if a token is not in the index
+        # no doc can survive
+        if len(posting_lists) == 0 or None in posting_lists:
+            return []
+
+        # intersect from the shortest posting list, so the intersection stays small
+        posting_lists.sort(key=len)
+        filtered_docs = set(posting_lists[0].doc_ids)
+        for posting_list in posting_lists[1:]:
+            filtered_docs.intersection_update(posting_list.doc_ids)
+
+        return list(filtered_docs)
 
     def naive_score(self, document : int, request_tokens : List[str]) -> float:
         """ Compute a naive score of a document for a given token list (request).
@@ -66,10 +95,11 @@ class Ranker:
         positions = []
         counts = []
         for token in request_tokens:
-            if token in self.index:
-                if document in self.index[token]:
-                    counts.append(self.index[token][document]['count'])
-                    positions += self.index[token][document]['positions']
+            posting_list = self.index.get(token)
+            if posting_list is not None:
+                if document in posting_list:
+                    counts.append(posting_list.count(document))
+                    positions += posting_list.positions_of(document)
             
         # position score
         if len(positions) > 1:
@@ -99,16 +129,21 @@ class Ranker:
             Var request_choice allow to choose between AND or OR request.
 
         """
-        if request_choice=="OR":
-            doc_indexes = self.get_doc_that_contains_at_least_one_req_tokens(request=request)
-        if request_choice=="AND":
-            doc_indexes = self.get_doc_that_contains_exactly_all_req_tokens(request=request)
+        self.instrumentation.count('requests')
+        with self.instrumentation.stage('candidates'):
+            if request_choice=="OR":
+                doc_indexes = self.get_doc_that_contains_at_least_one_req_tokens(request=request)
+            if request_choice=="AND":
+                doc_indexes = self.get_doc_that_contains_exactly_all_req_tokens(request=request)
+        self.instrumentation.count('candidates', len(doc_indexes))
 
         request_tokens = self.tokenizer.tokenize(content=request)
         scores = {}
-        for doc_index in doc_indexes:
-            scores[doc_index] = self.naive_score(doc_index, request_tokens)
-        sorted_by_scores = dict(sorted(scores.items(), key=lambda item: item[1], reverse=True))
+        with self.instrumentation.stage('scoring'):
+            for doc_index in doc_indexes:
+                scores[doc_index] = self.naive_score(doc_index, request_tokens)
+        with self.instrumentation.stage('sort'):
+            sorted_by_scores = dict(sorted(scores.items(), key=lambda item: item[1], reverse=True))
         self.display_info(len(sorted_by_scores.keys()))
         return sorted_by_scores
 
@@ -117,9 +152,10 @@ class Ranker:
         doc_scores = self.compute_scores(request=request,request_choice=request_choice)
         index_best_docs = list(doc_scores.keys())[:treshold]
         ranked = []
-        for index_best_doc in index_best_docs:
-            for document in self.doc:
-                if document['id'] == int(index_best_doc):
+        with self.instrumentation.stage('materialize'):
+            for index_best_doc in index_best_docs:
+                document = self.doc_by_id.get(index_best_doc)
+                if document is not None:
                     ranked.append({'url' : document['url'], 
                                    'title' : document['title']})
 
@@ -148,6 +184,11 @@ def main() -> None:
     parser.add_argument('--request', '-r', default="")
     parser.add_argument('--request_choice', '-f', default="OR")
     parser.add_argument('--max_urls', '-m', default=30)
+    parser.add_argument('--index', '-i', default="title_pos_index.json")
+    parser.add_argument('--tokenizer', '-t', default="whitespace")
+    parser.add_argument('--stemmerize', '-s', default="False")
+    parser.add_argument('--metrics', '-mf', default="")
+    parser.add_argument('--profile', '-pf', default="")
 
     args = parser.parse_args()
 
@@ -155,24 +196,48 @@ def main() -> None:
     request = args.request
     filter_and_or = args.request_choice
     max_urls = int(args.max_urls)
+    # a compact index saved next to the JSON one (index/main.py --compact) loads faster
+    index_filename = prefer_compact_index(args.index)
+    tokenizer_mode = args.tokenizer
+    stemmerize = eval(args.stemmerize)
+    metrics = args.metrics
+    profile = args.profile
     
     print(" --------------------- ")
     print(" Parameters: ")
     print(f"request : {request}")
     print(f"filter : {filter_and_or}") 
     print(f"max urls to display : {max_urls}") 
+    print(f"index : {index_filename}")
+    print(f"tokenizer (index without saved analyzer) : {tokenizer_mode}")
+    print(f"stemmerize (index without saved analyzer) : {stemmerize}")
+    print(f"metrics : {metrics}")
+    print(f"profile : {profile}")
+
+    instrumentation = setup_instrumentation(namespace='ranker',
+                                            metrics=metrics,
+                                            prometheus_port=0,
+                                            profile=profile)
 
 
-    with open('title_pos_index.json', 'r') as json_file:
-        title_index = json.load(json_file)
+    # a compact index (.cidx) is loaded lazily, a JSON index is converted to a compact index
+    title_index = load_index(index_filename)
     
     with open('documents.json', 'r') as json_file:
         documents = json.load(json_file)
     
-    ranker = Ranker(title_index, documents)
+    # the analyzer saved with the index is used, the args only describe
+    # how an index without saved analyzer was built
+    analyzer = None
+    if "analyzer" not in title_index.metadata:
+        analyzer = Analyzer(tokenizer=tokenizer_mode, stemming=stemmerize, instrumentation=instrumentation)
+
+    ranker = Ranker(title_index, documents, instrumentation=instrumentation, analyzer=analyzer)
     ranked = ranker.rank(request = request, request_choice=filter_and_or , treshold=max_urls)
     ranker.display_ranked(ranked)
 
+    teardown_instrumentation(instrumentation, metrics=metrics, profile=profile)
+
 
 if __name__ == "__main__":
     main()